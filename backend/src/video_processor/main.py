@@ -13,6 +13,7 @@ from multiprocessing import Process
 import asyncio
 import uuid
 import aiofiles
+from worker import MAX_CONCURRENT_JOBS  # per worker process
 
 app = FastAPI()
 
@@ -29,9 +30,6 @@ app.add_middleware(
 UPLOAD_DIR = os.path.abspath("videos")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-# Maximum number of concurrent jobs
-MAX_CONCURRENT_JOBS = 2
-
 def get_redis_client():
     redis_host = os.getenv('REDIS_HOST', 'localhost')
     redis_port = int(os.getenv('REDIS_PORT', 6379))
@@ -67,10 +65,15 @@ class JobStatus(Enum):
 
 class ConversionStatus(BaseModel):
     resolution: str
+    # waiting, pending, processing, completed, failed or skipped
     status: str
     progress: float
     output_url: Optional[str] = None
     error: Optional[str] = None
+    # Actual encoded size, which can be smaller than the resolution name
+    width: Optional[int] = None
+    height: Optional[int] = None
+    note: Optional[str] = None
 
 class JobStatusResponse(BaseModel):
     job_id: str
@@ -79,6 +82,7 @@ class JobStatusResponse(BaseModel):
     completed_at: Optional[datetime] = None
     conversions: Dict[str, ConversionStatus]
     job_data: Optional[dict] = None
+    analysis: Optional[dict] = None
 
 class JobsList(BaseModel):
     total: int
@@ -171,7 +175,10 @@ async def get_job_status(job_id: str):
                 status=conv.get("status", "waiting"),
                 progress=float(conv.get("progress", 0)),
                 output_url=conv.get("output_url"),
-                error=conv.get("error")
+                error=conv.get("error"),
+                width=conv.get("width"),
+                height=conv.get("height"),
+                note=conv.get("note")
             )
         job_dict["conversions"] = formatted_conversions
         
@@ -211,7 +218,10 @@ async def list_jobs(skip: int = 0, limit: int = 10):
                             status=conv.get("status", "waiting"),
                             progress=float(conv.get("progress", 0)),
                             output_url=conv.get("output_url"),
-                            error=conv.get("error")
+                            error=conv.get("error"),
+                            width=conv.get("width"),
+                            height=conv.get("height"),
+                            note=conv.get("note")
                         )
                     job_dict["conversions"] = formatted_conversions
                     
@@ -246,6 +256,12 @@ async def download_video(job_id: str, resolution: str):
     if resolution not in job_status["conversions"]:
         raise HTTPException(status_code=404, detail="Resolution not found")
     
+    if job_status["conversions"][resolution]["status"] == "skipped":
+        raise HTTPException(
+            status_code=404,
+            detail=f"Resolution was skipped: {job_status['conversions'][resolution].get('note', '')}"
+        )
+
     if job_status["conversions"][resolution]["status"] != "completed":
         raise HTTPException(status_code=400, detail="Video conversion not completed")
     
@@ -1,14 +1,14 @@
 import redis
+from redis import asyncio as aioredis
 import json
-import time
-from concurrent.futures import ProcessPoolExecutor
+import asyncio
 import signal
-import sys
-import subprocess
 import os
+from collections import deque
 from datetime import datetime
+from typing import Optional
 
-def get_redis_client():
+async def get_redis_client():
     redis_host = os.getenv('REDIS_HOST', 'localhost')
     redis_port = int(os.getenv('REDIS_PORT', 6379))
     max_retries = 5
@@ -16,25 +16,71 @@ def get_redis_client():
 
     for attempt in range(max_retries):
         try:
-            client = redis.Redis(
+            client = aioredis.Redis(
                 host=redis_host,
                 port=redis_port,
                 decode_responses=True,
                 socket_timeout=5
             )
-            client.ping()  # Test connection
+            await client.ping()  # Test connection
             print(f"Successfully connected to Redis at {redis_host}:{redis_port}")
             return client
         except redis.ConnectionError as e:
             if attempt < max_retries - 1:
                 print(f"Failed to connect to Redis (attempt {attempt + 1}/{max_retries}). Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
+                await asyncio.sleep(retry_delay)
             else:
                 raise Exception(f"Could not connect to Redis after {max_retries} attempts: {str(e)}")
 
 redis_client = None
-MAX_CONCURRENT_JOBS = 2
-process_pool = ProcessPoolExecutor(max_workers=MAX_CONCURRENT_JOBS)
+# Both limits apply per worker process, not per container or cluster.
+# Number of ffmpeg processes allowed to run at once across all jobs
+MAX_ENCODE_SLOTS = int(os.getenv('MAX_ENCODE_SLOTS', os.cpu_count() or 1))
+# Jobs are picked up while an encode slot is free, up to this many at once
+MAX_CONCURRENT_JOBS = int(os.getenv('MAX_CONCURRENT_JOBS', MAX_ENCODE_SLOTS))
+ENCODE_TIMEOUT = 3600  # 1 hour per rendition
+STDERR_TAIL_LINES = 50
+
+# Content-adaptive ladder: a fast low-resolution probe encode of a few sampled
+# segments decides how many bits each title actually needs.
+CONTENT_ADAPTIVE_LADDER = os.getenv('CONTENT_ADAPTIVE_LADDER', 'true').lower() == 'true'
+DEFAULT_CRF = 23
+ANALYSIS_SAMPLES = 3
+ANALYSIS_SEGMENT_SECONDS = 4
+ANALYSIS_HEIGHT = 240
+ANALYSIS_TIMEOUT = 300
+# Probe bitrates are normalised to this frame rate before classification,
+# using the frame count the probe encode actually produced. The factor is
+# clamped so a bogus frame count cannot swing the class by orders of magnitude.
+ANALYSIS_REFERENCE_FPS = 30
+ANALYSIS_FPS_FACTOR_RANGE = (0.25, 2.0)
+
+# (max probe bitrate in kbps, complexity class, CRF offset, maxrate factor)
+# Thresholds apply to the 240p ultrafast CRF 23 probe normalised to 30 fps.
+# They are hand-picked starting points, not fitted to a corpus: slides and
+# screen captures should land under 150 kbps, typical camera footage between
+# 150 and 400, and sports or other high-motion content above that.
+COMPLEXITY_CLASSES = [
+    (150, "low", 4, 0.6),
+    (400, "medium", 0, 1.0),
+    (None, "high", -2, 1.4)
+]
+
+# Peak bitrate (kbps) for a medium-complexity title at each resolution
+REFERENCE_MAXRATES = {
+    "4K": 16000,
+    "1080p": 5000,
+    "720p": 3000,
+    "480p": 1500,
+    "360p": 800,
+    "240p": 400,
+    "144p": 200
+}
+
+encode_slots = None
+running_processes = set()
+# Serialises read-modify-write of each job document between its renditions
+job_locks = {}
 
 class Resolution:
     def __init__(self, width: int, height: int):
@@ -54,187 +100,456 @@ class Resolution:
         }
         return resolutions.get(res, Resolution(854, 480))
 
-def update_job_status(job_id: str, resolution: str, status: dict):
+async def update_job(job_id: str, fields: dict, conversion_fields: Optional[dict] = None) -> dict:
+    async with job_locks.setdefault(job_id, asyncio.Lock()):
+        job_data = json.loads(await redis_client.get(f"job:{job_id}"))
+        job_data.update(fields)
+        if conversion_fields:
+            for conversion in job_data['conversions'].values():
+                conversion.update(conversion_fields)
+        await redis_client.set(f"job:{job_id}", json.dumps(job_data))
+        return job_data
+
+async def update_job_status(job_id: str, resolution: str, status: dict):
     try:
-        job_data = json.loads(redis_client.get(f"job:{job_id}"))
-        job_data['conversions'][resolution].update(status)
-        
-        # Calculate overall progress
-        total_progress = sum(conv['progress'] for conv in job_data['conversions'].values())
-        job_data['progress'] = total_progress / len(job_data['conversions'])
-        
-        redis_client.set(f"job:{job_id}", json.dumps(job_data))
+        async with job_locks.setdefault(job_id, asyncio.Lock()):
+            job_data = json.loads(await redis_client.get(f"job:{job_id}"))
+            job_data['conversions'][resolution].update(status)
+
+            # Calculate overall progress
+            total_progress = sum(conv['progress'] for conv in job_data['conversions'].values())
+            job_data['progress'] = total_progress / len(job_data['conversions'])
+
+            await redis_client.set(f"job:{job_id}", json.dumps(job_data))
         print(f"Updated status for job {job_id}, resolution {resolution}: {status}")
     except Exception as e:
         print(f"Error updating job status: {str(e)}")
 
-def process_video_in_worker(job_id: str, input_url: str, resolution: str) -> dict:
+async def run_command(cmd, timeout: float = 60):
+    """Run a short command (e.g. ffprobe) and return (returncode, stdout, stderr)."""
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    running_processes.add(process)
     try:
-        print(f"Starting processing for job {job_id}, resolution {resolution}")
-        UPLOAD_DIR = os.path.abspath("videos")
-        os.makedirs(UPLOAD_DIR, exist_ok=True)
-        output_path = os.path.join(UPLOAD_DIR, f"{job_id}_{resolution}.mp4")
-        target_res = Resolution.from_string(resolution)
-        
-        # Check if input file exists
-        if not os.path.exists(input_url):
-            raise FileNotFoundError(f"Input file not found: {input_url}")
-        
-        # Get video duration
-        duration_cmd = [
-            'ffprobe', '-v', 'error', '-show_entries', 'format=duration',
-            '-of', 'default=noprint_wrappers=1:nokey=1', input_url
-        ]
-        duration = float(subprocess.check_output(duration_cmd).decode().strip())
-        
-        # Get input resolution
-        probe_cmd = [
-            'ffprobe', '-v', 'error', '-select_streams', 'v:0',
-            '-show_entries', 'stream=width,height',
-            '-of', 'csv=p=0', input_url
-        ]
-        result = subprocess.run(probe_cmd, capture_output=True, text=True)
-        if result.returncode != 0:
-            raise Exception(f"Failed to probe video: {result.stderr}")
-            
-        input_width, input_height = map(int, result.stdout.strip().split(','))
-        print(f"Input resolution: {input_width}x{input_height}")
-        print(f"Target resolution: {target_res.width}x{target_res.height}")
-
-        # Start conversion
-        cmd = [
-            'ffmpeg', '-i', input_url,
-            '-c:v', 'libx264', '-crf', '23',
-            '-preset', 'medium',
-            '-vf', f'scale={target_res.width}:{target_res.height}',
-            '-c:a', 'aac',
-            '-progress', 'pipe:1',
-            '-y', output_path
-        ]
-        
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        return process.returncode, stdout.decode().strip(), stderr.decode().strip()
+    except asyncio.TimeoutError:
+        raise Exception(f"{cmd[0]} timed out after {timeout} seconds")
+    finally:
+        await kill_process(process)
+
+async def kill_process(process):
+    """Kill a child process if it is still running and reap it."""
+    running_processes.discard(process)
+    if process.returncode is None:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+        await process.wait()
+
+async def read_progress(stream, job_id: str, resolution: str, duration: float):
+    last_reported = -1
+    while True:
+        line = await stream.readline()
+        if not line:
+            break
+        line = line.decode(errors='replace')
+        if line.startswith('out_time='):
+            time_str = line.split('=')[1].strip()
+            if ':' in time_str:
+                h, m, s = time_str.split(':')
+                time_processed = float(h) * 3600 + float(m) * 60 + float(s)
+                progress = min(98, (time_processed / duration) * 100) if duration > 0 else 0
+                # Only write the job document when a whole percent is crossed
+                if int(progress) <= last_reported:
+                    continue
+                last_reported = int(progress)
+                await update_job_status(job_id, resolution, {
+                    "status": "processing",
+                    "progress": progress
+                })
+
+async def drain_stderr(stream, tail: deque):
+    # Keep reading so a chatty ffmpeg never blocks on a full pipe
+    while True:
+        line = await stream.readline()
+        if not line:
+            break
+        tail.append(line.decode(errors='replace').rstrip())
+
+async def count_bytes(stream) -> int:
+    total = 0
+    while True:
+        chunk = await stream.read(65536)
+        if not chunk:
+            return total
+        total += len(chunk)
+
+async def run_ffmpeg(cmd, read_stdout, timeout: float, stderr_tail: Optional[deque] = None):
+    """Run ffmpeg, feeding stdout to read_stdout while draining stderr.
+
+    Returns whatever read_stdout returns. Raises on timeout or non-zero exit.
+    Pass stderr_tail to inspect the last stderr lines after a successful run.
+    """
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    running_processes.add(process)
+    if stderr_tail is None:
+        stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+
+    # Awaiting the gather inside a coroutine lets cancellation propagate
+    # without leaving an unretrieved exception on the gather future
+    async def pump():
+        return await asyncio.gather(
+            read_stdout(process.stdout),
+            drain_stderr(process.stderr, stderr_tail),
+            process.wait()
         )
 
-        # Monitor progress
-        time_processed = 0
-        while True:
-            line = process.stdout.readline()
-            if not line and process.poll() is not None:
-                break
-                
-            if line.startswith('out_time='):
-                time_str = line.split('=')[1].strip()
-                if ':' in time_str:
-                    h, m, s = time_str.split(':')
-                    time_processed = float(h) * 3600 + float(m) * 60 + float(s)
-                    progress = min(98, (time_processed / duration) * 100)
-                    update_job_status(job_id, resolution, {
-                        "status": "processing",
-                        "progress": progress
-                    })
-
-        if process.returncode == 0:
+    try:
+        stdout_result, _, returncode = await asyncio.wait_for(pump(), timeout)
+    except asyncio.TimeoutError:
+        raise Exception(f"FFmpeg timed out after {timeout} seconds")
+    finally:
+        await kill_process(process)
+
+    if returncode != 0:
+        raise Exception(f"FFmpeg failed: {chr(10).join(stderr_tail)}")
+    return stdout_result
+
+async def probe_input(input_url: str) -> dict:
+    # Check if input file exists
+    if not os.path.exists(input_url):
+        raise FileNotFoundError(f"Input file not found: {input_url}")
+
+    # Get video duration
+    returncode, stdout, stderr = await run_command([
+        'ffprobe', '-v', 'error', '-show_entries', 'format=duration',
+        '-of', 'default=noprint_wrappers=1:nokey=1', input_url
+    ])
+    if returncode != 0:
+        raise Exception(f"Failed to probe duration: {stderr}")
+    duration = float(stdout)
+
+    # Get input resolution
+    returncode, stdout, stderr = await run_command([
+        'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+        '-show_entries', 'stream=width,height',
+        '-of', 'csv=p=0', input_url
+    ])
+    if returncode != 0:
+        raise Exception(f"Failed to probe video: {stderr}")
+
+    width, height = map(int, stdout.split(','))
+    print(f"Input resolution: {width}x{height}, duration: {duration}s")
+    return {"duration": duration, "width": width, "height": height}
+
+async def analyze_complexity(job_id: str, input_url: str, source: dict) -> dict:
+    """Probe-encode sampled segments at low resolution and classify the title."""
+    duration = source["duration"]
+    total_bytes = 0
+    total_seconds = 0.0
+    total_frames = 0
+    samples = 0
+    async with encode_slots:
+        for i in range(ANALYSIS_SAMPLES):
+            start = max(0.0, duration * (i + 1) / (ANALYSIS_SAMPLES + 1) - ANALYSIS_SEGMENT_SECONDS / 2)
+            seconds = min(ANALYSIS_SEGMENT_SECONDS, duration - start)
+            if seconds <= 0:
+                continue
+            cmd = [
+                'ffmpeg', '-ss', f'{start:.3f}', '-t', f'{seconds:.3f}',
+                '-i', input_url,
+                '-an', '-vf', f'scale=-2:{ANALYSIS_HEIGHT}',
+                '-c:v', 'libx264', '-crf', str(DEFAULT_CRF),
+                '-preset', 'ultrafast',
+                '-progress', 'pipe:2',
+                '-nostats',
+                '-f', 'h264', 'pipe:1'
+            ]
+            stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+            total_bytes += await run_ffmpeg(cmd, count_bytes, ANALYSIS_TIMEOUT, stderr_tail)
+            # The last progress block reports the frames the encode produced
+            frames = [line for line in stderr_tail if line.startswith('frame=')]
+            if frames:
+                total_frames += int(frames[-1].split('=')[1])
+            total_seconds += seconds
+            samples += 1
+
+    if total_seconds <= 0:
+        raise Exception("No segments available for analysis")
+
+    probe_kbps = total_bytes * 8 / total_seconds / 1000
+    # A higher frame rate spends more bits on the same content, so compare
+    # titles at a common frame rate
+    probe_fps = total_frames / total_seconds
+    if probe_fps > 0:
+        low, high = ANALYSIS_FPS_FACTOR_RANGE
+        probe_kbps *= min(high, max(low, ANALYSIS_REFERENCE_FPS / probe_fps))
+    for max_kbps, name, crf_offset, maxrate_factor in COMPLEXITY_CLASSES:
+        if max_kbps is None or probe_kbps < max_kbps:
+            break
+    print(f"Complexity for job {job_id}: {name} ({probe_kbps:.0f} kbps probe at {ANALYSIS_REFERENCE_FPS} fps)")
+    return {
+        "complexity": name,
+        "probe_kbps": round(probe_kbps, 1),
+        "probe_fps": round(probe_fps, 3),
+        "samples": samples,
+        "crf_offset": crf_offset,
+        "maxrate_factor": maxrate_factor
+    }
+
+def fit_resolution(target_res: Resolution, source: dict):
+    """Fit the source inside the target box, keeping its aspect ratio and never upscaling."""
+    scale = min(target_res.width / source["width"], target_res.height / source["height"], 1.0)
+    width = max(2, int(round(source["width"] * scale / 2)) * 2)
+    height = max(2, int(round(source["height"] * scale / 2)) * 2)
+    return width, height
+
+def build_ladder(resolutions, source: dict, complexity: Optional[dict]) -> dict:
+    """Pick encode settings for each requested rendition.
+
+    Each rendition is the source fitted inside the rendition's box with its
+    aspect ratio kept and no upscaling, whether or not analysis ran. When
+    several renditions come out the same size only the smallest requested one
+    is encoded and the others are skipped. Without a complexity result the
+    encoded renditions get the fixed default CRF; with one, CRF and peak
+    bitrate follow the title's complexity.
+    """
+    sizes = {resolution: fit_resolution(Resolution.from_string(resolution), source) for resolution in resolutions}
+    encoded_by_size = {}
+    for resolution in sorted(resolutions, key=lambda resolution: Resolution.from_string(resolution).height):
+        encoded_by_size.setdefault(sizes[resolution], resolution)
+
+    ladder = {}
+    for resolution in resolutions:
+        target_res = Resolution.from_string(resolution)
+        width, height = sizes[resolution]
+        if encoded_by_size[(width, height)] != resolution:
+            ladder[resolution] = {
+                "skipped": True,
+                "note": f"Source is {source['width']}x{source['height']}; {resolution} would duplicate "
+                        f"the {width}x{height} output of {encoded_by_size[(width, height)]}"
+            }
+            continue
+
+        settings = {
+            "width": width,
+            "height": height,
+            "crf": DEFAULT_CRF
+        }
+        if width < target_res.width and height < target_res.height:
+            # The source is smaller than this rendition's box
+            settings["note"] = f"Source is {source['width']}x{source['height']}; encoded at {width}x{height}, not upscaled"
+        if complexity:
+            settings["crf"] = DEFAULT_CRF + complexity["crf_offset"]
+            # Budget by the largest ladder rung that fits the encoded height
+            rung = max(
+                (name for name in REFERENCE_MAXRATES
+                 if Resolution.from_string(name).height <= height),
+                key=lambda name: Resolution.from_string(name).height,
+                default="144p"
+            )
+            settings["maxrate_kbps"] = int(REFERENCE_MAXRATES[rung] * complexity["maxrate_factor"])
+        ladder[resolution] = settings
+    return ladder
+
+def remove_partial_output(output_path: str):
+    try:
+        if os.path.exists(output_path):
+            os.unlink(output_path)
+    except OSError as e:
+        print(f"Error deleting partial output {output_path}: {str(e)}")
+
+async def process_video(job_id: str, input_url: str, resolution: str, duration: float, settings: dict) -> dict:
+    UPLOAD_DIR = os.path.abspath("videos")
+    output_path = os.path.join(UPLOAD_DIR, f"{job_id}_{resolution}.mp4")
+    try:
+        async with encode_slots:
+            print(f"Starting processing for job {job_id}, resolution {resolution}")
+            os.makedirs(UPLOAD_DIR, exist_ok=True)
+            print(f"Target resolution: {settings['width']}x{settings['height']}, CRF {settings['crf']}")
+
+            # Start conversion
+            cmd = [
+                'ffmpeg', '-i', input_url,
+                '-c:v', 'libx264', '-crf', str(settings['crf']),
+                '-preset', 'medium'
+            ]
+            if settings.get('maxrate_kbps'):
+                cmd += [
+                    '-maxrate', f"{settings['maxrate_kbps']}k",
+                    '-bufsize', f"{settings['maxrate_kbps'] * 2}k"
+                ]
+            cmd += [
+                '-vf', f"scale={settings['width']}:{settings['height']}",
+                '-c:a', 'aac',
+                '-progress', 'pipe:1',
+                '-nostats',
+                '-y', output_path
+            ]
+
+            await run_ffmpeg(
+                cmd,
+                lambda stream: read_progress(stream, job_id, resolution, duration),
+                ENCODE_TIMEOUT
+            )
+
             if os.path.exists(output_path):
                 result = {
                     "status": "completed",
                     "progress": 100,
-                    "output_url": f"/download/{job_id}/{resolution}"
+                    "output_url": f"/download/{job_id}/{resolution}",
+                    "width": settings['width'],
+                    "height": settings['height']
                 }
+                if settings.get('note'):
+                    result["note"] = settings['note']
                 print(f"Successfully processed {resolution} for job {job_id}")
                 return result
             else:
                 raise Exception("Output file not created")
-        else:
-            stderr = process.stderr.read()
-            raise Exception(f"FFmpeg failed: {stderr}")
 
+    except asyncio.CancelledError:
+        remove_partial_output(output_path)
+        raise
     except Exception as e:
         print(f"Error processing {resolution} for job {job_id}: {str(e)}")
+        remove_partial_output(output_path)
         return {
             "status": "failed",
             "progress": 0,
             "error": str(e)
         }
 
-def handle_job(job_id: str):
+async def handle_job(job_id: str):
+    released = False
     try:
         print(f"Starting job {job_id}")
-        job_data = json.loads(redis_client.get(f"job:{job_id}"))
-        job_data['status'] = 'processing'
-        redis_client.set(f"job:{job_id}", json.dumps(job_data))
-        
-        futures = []
-        for resolution in job_data['job_data']['resolutions']:
-            future = process_pool.submit(
-                process_video_in_worker,
-                job_id,
-                job_data['job_data']['input_url'],
-                resolution
-            )
-            futures.append((resolution, future))
-        
-        all_completed = True
-        for resolution, future in futures:
+        job_data = await update_job(job_id, {'status': 'processing'})
+
+        input_url = job_data['job_data']['input_url']
+        resolutions = job_data['job_data']['resolutions']
+        source = await probe_input(input_url)
+
+        analysis = {"content_adaptive": CONTENT_ADAPTIVE_LADDER}
+        complexity = None
+        if CONTENT_ADAPTIVE_LADDER:
             try:
-                result = future.result(timeout=3600)  # 1 hour timeout
-                job_data['conversions'][resolution].update(result)
-                if result['status'] != 'completed':
-                    all_completed = False
+                complexity = await analyze_complexity(job_id, input_url, source)
+                analysis.update(complexity)
             except Exception as e:
-                all_completed = False
-                job_data['conversions'][resolution].update({
-                    "status": "failed",
-                    "progress": 0,
-                    "error": str(e)
+                # Fall back to the fixed ladder rather than failing the job
+                print(f"Complexity analysis failed for job {job_id}: {str(e)}")
+                analysis['error'] = str(e)
+        analysis['ladder'] = build_ladder(resolutions, source, complexity)
+
+        await update_job(job_id, {'analysis': analysis})
+
+        encoded = [resolution for resolution in resolutions if not analysis['ladder'][resolution].get('skipped')]
+        for resolution in resolutions:
+            if resolution not in encoded:
+                await update_job_status(job_id, resolution, {
+                    "status": "skipped",
+                    "progress": 100,
+                    "note": analysis['ladder'][resolution]['note']
                 })
-            
-            redis_client.set(f"job:{job_id}", json.dumps(job_data))
-        
-        job_data['status'] = 'completed' if all_completed else 'failed'
-        job_data['completed_at'] = datetime.now().isoformat()
-        redis_client.set(f"job:{job_id}", json.dumps(job_data))
+
+        results = await asyncio.gather(*(
+            process_video(job_id, input_url, resolution, source['duration'], analysis['ladder'][resolution])
+            for resolution in encoded
+        ))
+
+        for resolution, result in zip(encoded, results):
+            await update_job_status(job_id, resolution, result)
+
+        all_completed = all(result['status'] == 'completed' for result in results)
+        job_data = await update_job(job_id, {
+            'status': 'completed' if all_completed else 'failed',
+            'completed_at': datetime.now().isoformat()
+        })
         print(f"Completed job {job_id} with status: {job_data['status']}")
-        
+
+    except asyncio.CancelledError:
+        # Worker is shutting down: reset the job and put it back at the
+        # consumer end of the queue so the next worker picks it up first.
+        # Release it from active_jobs before requeueing so a worker that pops
+        # it straight away does not lose its claim to our cleanup.
+        print(f"Job {job_id} cancelled, requeueing")
+        try:
+            await redis_client.srem("active_jobs", job_id)
+            released = True
+            await update_job(
+                job_id,
+                {'status': 'waiting', 'progress': 0},
+                {"status": "waiting", "progress": 0}
+            )
+            await redis_client.rpush("job_queue", job_id)
+        except Exception as e:
+            print(f"Error requeueing job {job_id}: {str(e)}")
+        raise
     except Exception as e:
         print(f"Error handling job {job_id}: {str(e)}")
         try:
-            job_data['status'] = 'failed'
-            job_data['error'] = str(e)
-            redis_client.set(f"job:{job_id}", json.dumps(job_data))
+            await update_job(job_id, {'status': 'failed', 'error': str(e)})
         except:
             pass
     finally:
-        redis_client.srem("active_jobs", job_id)
+        job_locks.pop(job_id, None)
+        if not released:
+            await redis_client.srem("active_jobs", job_id)
+
+async def run_worker():
+    global encode_slots
+    encode_slots = asyncio.Semaphore(MAX_ENCODE_SLOTS)
+    stop_event = asyncio.Event()
+    job_tasks = set()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop_event.set)
 
-def start_worker():
-    global redis_client
-    redis_client = get_redis_client()
-    
-    def handle_exit(signum, frame):
-        print("Shutting down worker...")
-        process_pool.shutdown()
-        sys.exit(0)
-    
-    signal.signal(signal.SIGTERM, handle_exit)
-    signal.signal(signal.SIGINT, handle_exit)
-    
     print("Worker started and waiting for jobs...")
-    while True:
+    while not stop_event.is_set():
         try:
-            if redis_client.scard("active_jobs") < MAX_CONCURRENT_JOBS:
-                job_id = redis_client.rpop("job_queue")
+            if len(job_tasks) < MAX_CONCURRENT_JOBS and not encode_slots.locked():
+                job_id = await redis_client.rpop("job_queue")
                 if job_id:
                     print(f"Found new job: {job_id}")
-                    redis_client.sadd("active_jobs", job_id)
-                    handle_job(job_id)
-            time.sleep(1)
+                    await redis_client.sadd("active_jobs", job_id)
+                    task = asyncio.create_task(handle_job(job_id))
+                    job_tasks.add(task)
+                    task.add_done_callback(job_tasks.discard)
+                    continue
         except Exception as e:
             print(f"Error in worker loop: {str(e)}")
-            time.sleep(1)
+        try:
+            await asyncio.wait_for(stop_event.wait(), 1)
+        except asyncio.TimeoutError:
+            pass
+
+    print("Shutting down worker...")
+    for task in job_tasks:
+        task.cancel()
+    await asyncio.gather(*job_tasks, return_exceptions=True)
+    for process in list(running_processes):
+        await kill_process(process)
+    await redis_client.close()
+
+async def main():
+    global redis_client
+    redis_client = await get_redis_client()
+    await run_worker()
+
+def start_worker():
+    asyncio.run(main())
 
 if __name__ == "__main__":
     start_worker()
@@ -19,6 +19,9 @@ interface Resolution {
   progress: number;
   output_url: string | null;
   error: string | null;
+  width?: number | null;
+  height?: number | null;
+  note?: string | null;
 }
 
 interface Job {
@@ -72,6 +75,8 @@ export const JobsList: React.FC<JobsListProps> = ({ onRefresh }) => {
         return 'bg-blue-500';
       case 'failed':
         return 'bg-red-500';
+      case 'skipped':
+        return 'bg-gray-400';
       default:
         return 'bg-gray-500';
     }
@@ -144,6 +149,9 @@ export const JobsList: React.FC<JobsListProps> = ({ onRefresh }) => {
                   <div className="flex justify-between items-center">
                     <div className="flex items-center gap-2">
                       <span className="font-medium">{resolution}</span>
+                      {data.width && data.height && (
+                        <span className="text-sm text-gray-500">{data.width}x{data.height}</span>
+                      )}
                       <Badge variant="secondary">{data.status}</Badge>
                     </div>
                     {data.output_url && (
@@ -161,6 +169,9 @@ export const JobsList: React.FC<JobsListProps> = ({ onRefresh }) => {
                   {data.error && (
                     <p className="text-sm text-red-500">{data.error}</p>
                   )}
+                  {data.note && (
+                    <p className="text-sm text-gray-500">{data.note}</p>
+                  )}
                 </div>
               ))}
             </div>